@@ -1,5 +1,25 @@
 # setup.py
+import os
+import shutil
+import sysconfig
+from pathlib import Path
+
 from setuptools import Extension, setup
+from setuptools.command.build_ext import build_ext
+
+# The debugger relies on the debug info for `s_ubeacon` and the trace hooks, so always build with
+# `-g`. Set UBEACON_DEBUG to build without optimizations when debugging the library itself.
+if os.environ.get("UBEACON_DEBUG"):
+    extra_compile_args = ["-O0", "-g"]
+else:
+    extra_compile_args = ["-O2", "-g", "-fno-strict-aliasing", "-fvisibility=hidden", "-fno-plt"]
+
+# Use ccache when it's available, so that rebuilding for another change to the sources, or after
+# the build directory was removed, reuses any objects which were compiled before. The compiler is
+# checked by content, as ccache can't tell when the compiler at a path has been upgraded.
+if "CC" not in os.environ and shutil.which("ccache"):
+    os.environ["CC"] = f"ccache {sysconfig.get_config_var('CC')}"
+    os.environ.setdefault("CCACHE_COMPILERCHECK", "content")
 
 module = Extension(
     "ubeacon",
@@ -9,12 +29,28 @@ module = Extension(
         "src/ubeacon/lib/trace.c",
         "src/ext/cJSON/cJSON.c",
     ],
-    extra_compile_args=["-O0", "-Isrc/ext/cJSON", "-std=c99"],
+    extra_compile_args=[*extra_compile_args, "-Isrc/ext/cJSON", "-std=c99"],
 )
 
+
+class RecordingBuildExt(build_ext):
+    """
+    Records where the library was built, so that it can be looked up without setuptools.
+
+    Each build base is only used for a single interpreter, so the record has a fixed name.
+    """
+
+    def run(self) -> None:
+        super().run()
+        build_base = self.get_finalized_command("build").build_base
+        record = Path(build_base, ".ubeacon_so_path")
+        record.write_text(str(Path(self.get_ext_fullpath("ubeacon")).resolve()))
+
+
 setup(
     name="ubeacon",
     version="1.0",
     description="Module for tracing function calls.",
     ext_modules=[module],
+    cmdclass={"build_ext": RecordingBuildExt},
 )
@@ -110,6 +110,10 @@ def uexperimental__python__record(udb: udb_base.Udb) -> None:
     If the debuggee is not a Python interpreter, or is not in a good state, an error
     message will be printed.
     """
+    _record_internal(udb)
+
+
+def _record_internal(udb: udb_base.Udb) -> None:
     with contextlib.suppress(Exception):
         ubeacon.clear()
     report.dev2("Injecting")
@@ -127,8 +131,10 @@ def uexperimental__python__record(udb: udb_base.Udb) -> None:
         ensure = debuggee.Function.from_symbol("PyGILState_Ensure")
         release = debuggee.Function.from_symbol("PyGILState_Release")
         lock = ensure()
-        yield
-        release(lock)
+        try:
+            yield
+        finally:
+            release(lock)
 
     open_args = "rb"
     with (
@@ -160,7 +166,7 @@ def uexperimental__python__run(udb: udb_base.Udb, args: str) -> None:
     the `args` will be passed to the application being run.
     """
     gdbutils.execute_to_string(f"upy start {args}")
-    gdb.execute("continue")
+    udb.execution.cont()
 
 
 @command.register(gdb.COMMAND_RUNNING, repeat=False, arg_parser=command_args.Integer())
@@ -174,7 +180,7 @@ def uexperimental__python__attach(udb: udb_base.Udb, pid: str) -> None:
     interpreter, start recording, and enable Python debugging.
     """
     gdb.execute(f"attach {pid}")
-    gdb.execute("upy record")
+    _record_internal(udb)
 
 
 @command.register(
@@ -190,17 +196,28 @@ def uexperimental__python__start(udb: udb_base.Udb, args: str) -> None:
     `args` will be passed to the application being started, and the interpreter will stop once
     initialization has begun.
     """
+    first_user_line = "s_ubeacon.current_file[0] != '<'"
 
     if udb.get_execution_mode().has_loaded_recording:
-        init_functions = [ubeacon.LINE_FN]
-    else:
-        init_functions = [
-            "Py_Initialize",
-            "Py_InitializeEx",
-            "_Py_InitializeMain",
-            "Py_InitializeFromConfig",
-        ]
+        # The UBeacon library was loaded at record time, so there is no need to stop for
+        # interpreter initialization: run straight to the first line of user code.
+        ubeacon.ready()
+        with (
+            gdbutils.breakpoints_suspended(),
+            ubeacon.internal_breakpoint(condition=first_user_line),
+        ):
+            udb.execution.cont()
+        report.user("Python has been initialized.")
+        return
+
+    init_functions = [
+        "Py_Initialize",
+        "Py_InitializeEx",
+        "_Py_InitializeMain",
+        "Py_InitializeFromConfig",
+    ]
     init_breakpoints: dict[str, gdb.Breakpoint] = {}
+    init_breakpoint_set: set[gdb.Breakpoint] = set()
 
     def enable_init_breakpoints(event: gdb.NewObjFileEvent | None) -> None:
         """
@@ -215,23 +232,25 @@ def uexperimental__python__start(udb: udb_base.Udb, args: str) -> None:
 
         Once we have detected that the symbols are available, this event handler is
         removed from GDB and further handling is done by the `complete_initialization`
-        stop event handler when one of the breakpoints is hit.
+        stop event handler when one of the breakpoints is hit. Not every version of Python
+        provides all of the initialization functions, but they all live in the same object
+        file, so finding any of them means that no later object file will provide the rest.
         """
         for init_function in init_functions:
-            if not debuggee.symbol_exists(init_function):
-                continue  # The symbol doesn't exist yet.
-
             if init_function in init_breakpoints:
                 continue  # We've already set this init breakpoint
 
+            if not debuggee.symbol_exists(init_function):
+                continue  # The symbol doesn't exist yet.
+
             report.dev2(f"Setting init breakpoint: {init_function}")
             init_breakpoints[init_function] = gdb.Breakpoint(
                 init_function, internal=True
             )
             init_breakpoints[init_function].silent = True
+            init_breakpoint_set.add(init_breakpoints[init_function])
 
-        all_init_breakpoints_set = len(init_functions) == len(init_breakpoints)
-        if all_init_breakpoints_set:
+        if init_breakpoints:
             gdb.events.new_objfile.disconnect(enable_init_breakpoints)
 
     def complete_initialization(event: gdb.StopEvent) -> None:
@@ -246,10 +265,7 @@ def uexperimental__python__start(udb: udb_base.Udb, args: str) -> None:
             # This probably means a signal, just stop and display the signal to the user
             return
 
-        init_breakpoint_hit = list(
-            set(event.breakpoints) & set(init_breakpoints.values())
-        )
-        if not init_breakpoint_hit:
+        if not any(bp in init_breakpoint_set for bp in event.breakpoints):
             return
 
         report.dev2("In complete init function")
@@ -257,6 +273,7 @@ def uexperimental__python__start(udb: udb_base.Udb, args: str) -> None:
         gdb.events.stop.disconnect(complete_initialization)
         for init_breakpoint in init_breakpoints.values():
             init_breakpoint.delete()
+        init_breakpoint_set.clear()
 
         finish_breakpoint = gdb.FinishBreakpoint(internal=True)
         finish_breakpoint.silent = True
@@ -270,20 +287,18 @@ def uexperimental__python__start(udb: udb_base.Udb, args: str) -> None:
         gdb.events.new_objfile.connect(enable_init_breakpoints)
         gdb.events.stop.connect(complete_initialization)
         enable_init_breakpoints(None)
-        if udb.get_execution_mode().has_loaded_recording:
-            gdb.execute("continue")
-            ubeacon.ready()
-        else:
-            gdb.execute(f"run {args}")
-            gdb.execute("upy record")
+        gdb.execute(f"run {args}")
+        _record_internal(udb)
 
-        with ubeacon.internal_breakpoint(condition="s_ubeacon.current_file[0] != '<'"):
-            gdb.execute("continue")
+        with ubeacon.internal_breakpoint(condition=first_user_line):
+            udb.execution.cont()
 
     report.user("Python has been initialized.")
 
 
-def _goto_boundary_internal(start: bool = True, show_message: bool = True) -> None:
+def _goto_boundary_internal(
+    udb: udb_base.Udb, start: bool = True, show_message: bool = True
+) -> None:
     # TODO: what happens if we can't find any python code?
     with (
         gdbutils.breakpoints_suspended(),
@@ -292,10 +307,10 @@ def _goto_boundary_internal(start: bool = True, show_message: bool = True) -> No
     ):
         if start:
             gdbutils.execute_to_string("ugo start")
-            gdb.execute("continue")
+            udb.execution.cont()
         else:
             gdbutils.execute_to_string("ugo end")
-            gdb.execute("reverse-continue")
+            udb.execution.reverse_cont()
 
 
 @command.register(gdb.COMMAND_RUNNING, repeat=False)
@@ -304,7 +319,7 @@ def uexperimental__python__go__start(udb: udb_base.Udb) -> None:
     Jump to the first line of Python code executed.
     """
     check_active()
-    _goto_boundary_internal(start=True)
+    _goto_boundary_internal(udb, start=True)
 
 
 @command.register(gdb.COMMAND_RUNNING, repeat=False)
@@ -313,7 +328,7 @@ def uexperimental__python__go__end(udb: udb_base.Udb) -> None:
     Jump to the last line of Python code executed.
     """
     check_active()
-    _goto_boundary_internal(start=False)
+    _goto_boundary_internal(udb, start=False)
 
 
 @command.register(
@@ -365,24 +380,29 @@ def uexperimental__python__reverse_step(udb: udb_base.Udb) -> None:
     _step_internal(udb.execution.reverse_cont)
 
 
-def _finish_internal(
-    move_fn: Callable[[], None], location: str = ubeacon.RET_FN
-) -> None:
-    # In a finish operation we want to run to the next line in the current frame, OR to the
-    # first line after this frame (i.e. after function return). We set breakpoints on those two
-    # things here.
+def _finish_internal(move_fn: Callable[[], None]) -> None:
+    # In a finish operation we want to run to the first line after this frame (i.e. after function
+    # return). That is the first line executed in the frame which called this one, so a single
+    # breakpoint is enough.
+    with ubeacon.internal_breakpoint(condition=ubeacon.one_frame_up()):
+        move_fn()
+
+
+def _reverse_finish_internal(move_fn: Callable[[], None]) -> None:
+    # In a reverse finish operation we want to run back to the call into this frame, then step to
+    # the line before it. We set a breakpoint on the call here.
     stay_in_frame = ubeacon.stay_in_frame()
     step_off_return = False
     with (
         ubeacon.internal_breakpoint(
-            location=location, condition=stay_in_frame
+            location=ubeacon.CALL_FN, condition=stay_in_frame
         ) as next_return,
     ):
         move_fn()
         if next_return.hit:
             step_off_return = True
     if step_off_return:
-        # Step to the next source line executed.
+        # Step to the previous source line executed.
         _step_internal(move_fn)
 
 
@@ -404,22 +424,27 @@ def uexperimental__python__reverse_finish(udb: udb_base.Udb) -> None:
     Execute backward until just before the current Python stack frame was entered.
     """
     check_active()
-    _finish_internal(move_fn=udb.execution.reverse_cont, location=ubeacon.CALL_FN)
+    _reverse_finish_internal(move_fn=udb.execution.reverse_cont)
 
 
-def _next_internal(
-    move_fn: Callable[[], None],
-    location: str = ubeacon.RET_FN,
-) -> None:
-    # In a finish operation we want to run to the next line in the current frame, OR to the
-    # first line after this frame (i.e. after function return). We set breakpoints on those two
-    # things here.
+def _next_internal(move_fn: Callable[[], None]) -> None:
+    # In a next operation we want to run to the next line in the current frame, OR to the
+    # first line after this frame (i.e. after function return). Both are covered by a single
+    # breakpoint on the next line, so this only takes one trip through the debuggee.
+    condition = f"{ubeacon.stay_in_frame()} || {ubeacon.one_frame_up()}"
+    with ubeacon.internal_breakpoint(condition=condition):
+        move_fn()
+
+
+def _reverse_next_internal(move_fn: Callable[[], None]) -> None:
+    # In a reverse next operation we want to run to the previous line in the current frame, OR to
+    # the line before this frame returned. We set breakpoints on those two things here.
     stay_in_frame = ubeacon.stay_in_frame()
     step_off_return = False
     with (
         ubeacon.internal_breakpoint(condition=stay_in_frame) as next_line,
         ubeacon.internal_breakpoint(
-            location=location, condition=stay_in_frame
+            location=ubeacon.RET_FN, condition=stay_in_frame
         ) as next_return,
     ):
         move_fn()
@@ -447,7 +472,7 @@ def uexperimental__python__reverse_next(udb: udb_base.Udb) -> None:
     Execute backward until just before the current Python stack frame was entered.
     """
     check_active()
-    _next_internal(move_fn=udb.execution.reverse_cont)
+    _reverse_next_internal(move_fn=udb.execution.reverse_cont)
 
 
 @command.register(
@@ -500,7 +525,7 @@ def uexperimental__python__break(udb: udb_base.Udb, location: str) -> None:
             )
         bp = ubeacon.FunctionBreakpoint(location)
 
-    ubeacon.breakpoints.append(bp)
+    ubeacon.breakpoints[bp.index] = bp
     report.user(bp.set_message)
 
 
@@ -517,10 +542,10 @@ def uexperimental__python__info__breakpoints(udb: udb_base.Udb) -> None:
     Lists all Python breakpoints.
     """
     check_active()
-    if len(ubeacon.breakpoints) == 0:
+    if not ubeacon.breakpoints:
         report.user("No Python breakpoints.")
 
-    for bp in ubeacon.breakpoints:
+    for bp in ubeacon.breakpoints.values():
         report.user(f"{bp.index}: {bp}")
 
 
@@ -542,25 +567,21 @@ def uexperimental__python__delete(udb: udb_base.Udb, num: int) -> None:
     To delete all breakpoints, give no argument.
     """
     check_active()
-    if len(ubeacon.breakpoints) == 0:
+    if not ubeacon.breakpoints:
         report.user("No Python breakpoints.")
+        return
 
-    delete_all = num == 0
-    remaining = []
-    did_something = False
-    for bp in ubeacon.breakpoints:
-        if bp.index == num or delete_all:
+    if num == 0:
+        for bp in ubeacon.breakpoints.values():
             bp.delete()
-            did_something = True
-        else:
-            remaining.append(bp)
+        ubeacon.breakpoints.clear()
+        return
 
-    if not did_something:
-        if delete_all:
-            report.user("No Python breakpoints")
-        else:
-            report.user(f"No Python breakpoint (number {num})")
-    ubeacon.breakpoints = remaining
+    bp = ubeacon.breakpoints.pop(num, None)
+    if bp is None:
+        report.user(f"No Python breakpoint (number {num})")
+    else:
+        bp.delete()
 
 
 @command.register(gdb.COMMAND_DATA, arg_parser=command_args.Untokenized())
@@ -580,7 +601,7 @@ def _exception_internal(
     move_fn: Callable[[], None], udb: udb_base.Udb, exception_type: str | None
 ) -> None:
     if not debuggee.symbol_exists(ubeacon.STATE_STRUCT):
-        _goto_boundary_internal(start=True, show_message=False)
+        _goto_boundary_internal(udb, start=True, show_message=False)
 
     with (
         gdbutils.breakpoints_suspended(),
@@ -591,7 +612,7 @@ def _exception_internal(
     ):
         next_exception.condition = ubeacon.exception_origin(exception_type)
         move_fn()
-    type_name = gdb.parse_and_eval("s_ubeacon.exception_type").string()
+    type_name = ubeacon.state_struct()["exception_type"].string()
     report.user(f"Hit exception of type {type_name}")
     report.user(ubeacon.stop_message())
 
@@ -655,7 +676,7 @@ def uexperimental__python__continue(udb: udb_base.Udb) -> None:
     a signal is received, or the program terminates.
     """
     check_active()
-    _continue_impl("continue")
+    _continue_impl(udb.execution.cont)
 
 
 @command.register(
@@ -673,10 +694,10 @@ def uexperimental__python__reverse_continue(udb: udb_base.Udb) -> None:
     is reached.
     """
     check_active()
-    _continue_impl("reverse-continue")
+    _continue_impl(udb.execution.reverse_cont)
 
 
-def _continue_impl(gdb_command: str) -> None:
+def _continue_impl(move_fn: Callable[[], None]) -> None:
     """Shared logic for continue and reverse-continue.
 
     When watches are active, a hardware watchpoint may fire at an
@@ -685,7 +706,7 @@ def _continue_impl(gdb_command: str) -> None:
     value actually changes or a non-watchpoint stop occurs.
     """
     while True:
-        gdb.execute(gdb_command)
+        move_fn()
         if not watch.any_pending():
             break
         if watch.evaluate_pending():
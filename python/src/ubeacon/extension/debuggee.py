@@ -5,18 +5,34 @@ TODO: talk about whether functions modify or not
 """
 
 import contextlib
+import dataclasses
 import functools
 from enum import Enum, auto
-from typing import Iterator
+from typing import Callable, Iterator
 
 import gdb  # ignore: mypy[import-untyped]
-from src.udbpy import ctrl_c, engine, report
+from src.udbpy import ctrl_c, report
 from src.udbpy.gdb_extensions import gdbutils
 from undo.debugger_extensions import udb as udb_base
 
 udb = udb_base._wrapped_udb  # pylint: disable=protected-access
 
+
+@functools.cache
 def symbol_exists(symbol_name: str) -> bool:
+    """
+    Determine whether a symbol is present in the debuggee.
+
+    The result is cached until the set of loaded object files changes.
+    """
+    if (
+        gdb.lookup_global_symbol(symbol_name) is not None
+        or gdb.lookup_static_symbol(symbol_name) is not None
+    ):
+        return True
+
+    # Symbols without debug info (e.g. in a stripped libpython) aren't found by the lookups above,
+    # but can still be evaluated.
     try:
         gdb.parse_and_eval(symbol_name)
         return True
@@ -64,13 +80,15 @@ class PythonState(Enum):
     """
 
 
+@functools.cache
 def python_state() -> PythonState:
     """
     Determine the state of the Python interpreter that is currently being debugged.
 
     This is the primary heuristic function that is used to identify whether a UDB debuggee is (or
     contains) a Python interpreter. It achieves this by looking for and calling various Python
-    symbols.
+    symbols. As this may involve calling into the debuggee, the result is cached until the debuggee
+    next moves (in either direction) or the set of loaded object files changes.
 
     Returns:
         The determined state of the Python interpreter.
@@ -96,17 +114,14 @@ def python_state() -> PythonState:
 
 @contextlib.contextmanager
 def allow_pending() -> Iterator[None]:
-    output = gdbutils.execute_to_string("show breakpoint pending")
-    was_on = "on" in output.lower()
+    # This is an auto-boolean parameter, where None means "auto".
+    previous = {True: "on", False: "off", None: "auto"}[gdb.parameter("breakpoint pending")]
 
     gdb.execute("set breakpoint pending on")
     try:
         yield
     finally:
-        if was_on:
-            gdb.execute("set breakpoint pending on")
-        else:
-            gdb.execute("set breakpoint pending off")
+        gdb.execute(f"set breakpoint pending {previous}")
 
 
 def is_python() -> bool:
@@ -128,18 +143,28 @@ def general_registers() -> dict[str, int]:
         as reported by GDB's `info registers` command.
     """
     arch = gdb.selected_inferior().architecture()
-    reg_names = [x.name for x in arch.registers("general")]
+    reg_names = _general_register_names.get(arch.name())
+    if reg_names is None:
+        reg_names = [x.name for x in arch.registers("general")]
+        _general_register_names[arch.name()] = reg_names
     frame = gdbutils.newest_frame()
+    uint64_t = gdb.lookup_type("uintptr_t")  # TODO arch specific
     reg_values = {}
     for reg_name in reg_names:
         reg_value = frame.read_register(reg_name)
-        uint64_t = gdb.lookup_type("uintptr_t")  # TODO arch specific
-        if int(reg_value) < 0:
-            reg_value = reg_value.cast(uint64_t)
-        reg_values[reg_name] = int(reg_value)
+        value = int(reg_value)
+        if value < 0:
+            value = int(reg_value.cast(uint64_t))
+        reg_values[reg_name] = value
     return reg_values
 
 
+_general_register_names: dict[str, list[str]] = {}
+"""
+Names of the general purpose registers, keyed by architecture name.
+"""
+
+
 @contextlib.contextmanager
 def injected_string(data: str) -> Iterator[int]:
     """
@@ -155,17 +180,32 @@ def injected_string(data: str) -> Iterator[int]:
         data: A string to be copied into the debuggee.
     """
     report.dev2(f"Injecting string: {data!r}")
-    c_str_len = len(data) + 1  # +1 for the NULL terminator
+    c_str = data.encode() + b"\x00"
 
     malloc = Function.from_symbol("malloc")
     free = Function.from_symbol("free")
 
-    result = malloc(c_str_len)
+    result = malloc(len(c_str))
     report.dev2(f"Malloc done: {data!r}, {result}")
-    gdbutils.execute_to_string(f'set {{char[{c_str_len}]}}{result} = "{data}"')
-    yield result
-    free(result)
-    report.dev2(f"Free done: {data!r}")
+    gdb.selected_inferior().write_memory(result, c_str)
+    try:
+        yield result
+    finally:
+        free(result)
+        report.dev2(f"Free done: {data!r}")
+
+
+def _write_register(name: str, value: int) -> None:
+    """
+    Set the value of a register in the newest frame.
+
+    Frame.write_register() was added in GDB 14, so older versions fall back to the `set` command.
+    """
+    frame = gdbutils.newest_frame()
+    if hasattr(frame, "write_register"):
+        frame.write_register(name, value)
+    else:
+        gdbutils.execute_to_string(f"set ${name}={value}")
 
 
 class _GeneralRegisters:
@@ -176,14 +216,17 @@ class _GeneralRegisters:
     def __init__(self) -> None:
         self._initial_regs = general_registers()
 
-    def __getitem__(self, key: str) -> int:
+    def read_current(self, key: str) -> int:
         """
-        Get the current value of a register.
+        Read the current value of a register from the debuggee.
+
+        Unlike `initial_pc`, this is not served from the snapshot taken on initialization, as it's
+        used to read results after the debuggee has run.
         """
         assert key in self._initial_regs, f"Unknown key: {key}"
-        value = gdbutils.newest_frame().read_register(key)
+        value = int(gdbutils.newest_frame().read_register(key))
         report.dev2(f"Read register {key}={value}")
-        return int(value)
+        return value
 
     def __setitem__(self, key: str, value: int) -> None:
         """
@@ -191,20 +234,23 @@ class _GeneralRegisters:
         """
         report.dev2(f"Setting register {key} to 0x{value:x}")
         assert key in self._initial_regs, f"Unknown key: {key}"
-        gdbutils.execute_to_string(f"set ${key}=0x{value:x}")
+        _write_register(key, value)
 
     @property
     def initial_pc(self) -> int:
-        return self._initial_regs["rip"]
+        return self._initial_regs[current_abi().pc]
 
     def restore(self) -> None:
         """
         Restore the registers to the state they were in when this class instance was initialized.
         """
-        report.dev2(f"Restoring registers to {self._initial_regs}")
+        # Writing a register flushes GDB's frame cache, so only write back those that changed.
+        current_regs = general_registers()
         for name, value in self._initial_regs.items():
+            if current_regs[name] == value:
+                continue
             report.dev2(f"setting register {name}={value}")
-            gdbutils.execute_to_string(f"set ${name}={value}")
+            _write_register(name, value)
 
 
 @contextlib.contextmanager
@@ -221,37 +267,35 @@ def temporary_registers() -> Iterator[_GeneralRegisters]:
         A helper class for getting/setting the registers. See `_GeneralRegisters`
     """
     regs = _GeneralRegisters()
-    yield regs
-    regs.restore()
+    try:
+        yield regs
+    finally:
+        regs.restore()
 
 
 @contextlib.contextmanager
-def temporary_memory(addr: int, data: list[int]) -> Iterator[None]:
+def temporary_memory(addr: int, data: bytes) -> Iterator[None]:
     """
     A context manager that temporarily writes some data into memory
 
     TODO: explain why this is needed more
     """
 
-    read_cmd = f"print/d *(unsigned char*){hex(addr)}@{len(data)}"
-    orig_data_str = gdbutils.execute_to_string(read_cmd)
-    orig_data = [int(x) for x in orig_data_str.split("=")[-1].strip()[1:-1].split(",")]
-    write_cmd = (
-        f"set {{char[{len(data)}]}} {hex(addr)} = {{" + ", ".join(map(str, data)) + "}"
-    )
-    gdbutils.execute_to_string(write_cmd)
-    yield
-    restore_cmd = (
-        f"set {{char[{len(orig_data)}]}} {hex(addr)} = {{"
-        + ", ".join(map(str, orig_data))
-        + "}"
-    )
-    gdbutils.execute_to_string(restore_cmd)
+    inferior = gdb.selected_inferior()
+    orig_data = bytes(inferior.read_memory(addr, len(data)))
+    inferior.write_memory(addr, data)
+    try:
+        yield
+    finally:
+        inferior.write_memory(addr, orig_data)
 
+@functools.cache
 def get_symbol_address(symbol_name: str) -> int:
     """
     Get the address of a symbol in the debuggee.
 
+    The result is cached until the set of loaded object files changes.
+
     Args:
         symbol_name: The name of the symbol to look up.
 
@@ -266,19 +310,188 @@ def get_symbol_address(symbol_name: str) -> int:
         print(f"Couldn't find symbol: {symbol_name}")
         raise
 
+
+@functools.cache
+def _executable_map_ends() -> list[int]:
+    """
+    Get the end addresses of the debuggee's executable memory maps, excluding special maps such
+    as `[vdso]`.
+
+    The result is cached until the set of loaded object files changes.
+    """
+    # this is lifted straight from out engine implementation of `info proc maps`, but only keeps
+    # the fields we need rather than building an `engine.MemoryMap` for every map.
+    ends = []
+    with ctrl_c.deferred():
+        udb.gdbserial.send("vUDB;get_debuggee_maps")
+        with udb.gdbserial.receive_packet():
+            n = udb.gdbserial.receive_number()
+            for _ in range(n):
+                udb.gdbserial.receive_number()  # begin
+                end = udb.gdbserial.receive_number()
+                udb.gdbserial.receive_number()  # offset
+                udb.gdbserial.receive_number()  # dev_major
+                udb.gdbserial.receive_number()  # dev_minor
+                udb.gdbserial.receive_number()  # inode
+                path = udb.gdbserial.receive_hexstr()
+                udb.gdbserial.receive_number()  # read
+                udb.gdbserial.receive_number()  # write
+                execute = bool(udb.gdbserial.receive_number())
+                udb.gdbserial.receive_number()  # shared
+                if execute and not path.startswith("["):
+                    ends.append(end)
+    return ends
+
+
+def _is_free_space(addr: int, length: int) -> bool:
+    # read_memory() returns a memoryview with format "c", which never compares equal to bytes, so
+    # it has to be converted first.
+    data = gdb.selected_inferior().read_memory(addr, length)
+    return bytes(data) == b"\x00" * length
+
+
+_executable_space: dict[int, int] = {}
+"""
+Addresses of free executable space previously found by `_find_executable_space`, keyed by length.
+"""
+
+
+def _find_executable_space(length: int) -> int:
+    """
+    Find `length` bytes of unused memory in an executable map, for injecting code into.
+    """
+    addr = _executable_space.get(length)
+    if addr is not None and _is_free_space(addr, length):
+        return addr
+
+    for end in _executable_map_ends():
+        # does this map have enough free space at the top end?
+        if _is_free_space(end - length, length):
+            _executable_space[length] = end - length
+            return end - length
+    assert False, "Can't find inject location"
+
+
+_return_breakpoints: dict[int, gdb.Breakpoint] = {}
+"""
+Breakpoints used to catch injected calls returning, keyed by address. These are only enabled while
+a call is in progress.
+
+This isn't cleared when object files change, as libraries may be loaded during an injected call.
+If the injection site moves a new breakpoint is created, and the old one stays disabled.
+"""
+
+
+def _return_breakpoint(addr: int) -> gdb.Breakpoint:
+    """
+    Get a disabled breakpoint at `addr`, reusing the one from previous calls where possible.
+    """
+    bp = _return_breakpoints.get(addr)
+    if bp is None or not bp.is_valid():
+        bp = gdb.Breakpoint(f"*{hex(addr)}", internal=True)
+        bp.silent = True
+        bp.enabled = False
+        _return_breakpoints[addr] = bp
+    return bp
+
+
+@dataclasses.dataclass(frozen=True)
+class _Abi:
+    """
+    The parts of an architecture's calling convention needed to inject calls into the debuggee.
+    """
+
+    pc: str
+    """Name of the program counter register."""
+    function: str
+    """Name of the register that `code` calls through."""
+    result: str
+    """Name of the register the return value is passed in."""
+    args: tuple[str, ...]
+    """Names of the registers used to pass integer arguments, in order."""
+    code: bytes
+    """Code injected into the debuggee to call the function whose address is in `function`."""
+
+
+# The nop is important here as this code will be injected at the top of an executable map.
+# Without the nop the debuggee will return to a SIGSEGV as it runs over the end of the map. With
+# the nop we can set a breakpoint and move the PC elsewhere.
+_ABIS = {
+    "i386:x86-64": _Abi(
+        pc="rip",
+        function="rax",
+        result="rax",
+        args=("rdi", "rsi", "rdx", "rcx", "r8", "r9"),
+        code=bytes(
+            [
+                0xFF,
+                0xD0,  # call rax
+                0x90,  # nop
+            ]
+        ),
+    ),
+    "aarch64": _Abi(
+        pc="pc",
+        function="x8",
+        result="x0",
+        args=tuple(f"x{i}" for i in range(8)),
+        code=bytes(
+            [
+                *(0x00, 0x01, 0x3F, 0xD6),  # blr x8
+                *(0x1F, 0x20, 0x03, 0xD5),  # nop
+            ]
+        ),
+    ),
+}
+"""
+Calling conventions for the supported architectures, keyed by GDB architecture name.
+"""
+
+
+def current_abi() -> _Abi:
+    """
+    Return the calling convention of the debuggee's architecture.
+    """
+    arch_name = gdb.selected_inferior().architecture().name()
+    abi = _ABIS.get(arch_name)
+    assert abi is not None, f"Unsupported architecture: {arch_name}"
+    return abi
+
+
 class Function:
+    """
+    A function in the debuggee which can be called such that the call is recorded.
+
+    GDB's own inferior function calls (e.g. `gdb.parse_and_eval("malloc(42)")`) are not part of
+    the recorded execution history, so they can't be used to load the UBeacon library into the
+    debuggee. Instead, a small trampoline is written into executable memory, the registers are set
+    up for the call, and the debuggee is run until the call returns, all while recording.
+    """
+
+    _by_name: dict[str, "Function"] = {}
+    """
+    Functions previously created by `from_symbol`, keyed by symbol name.
+    """
+
     @classmethod
     def from_symbol(cls, name: str) -> "Function":
         """
         Initialise a Function object from a symbol rather than an address.
 
+        The result is cached until the set of loaded object files changes.
+
         Args:
             name: The name of the function to be called in the debuggee.
         """
+        function = cls._by_name.get(name)
+        if function is not None:
+            return function
+
         try:
             report.dev1(f"Setting up recorded call to: {name}")
             addr = get_symbol_address(name)
-            return cls(addr, name)
+            function = cls._by_name[name] = cls(addr, name)
+            return function
         except Exception:
             print(f"Couldn't find symbol: {name}")
             raise
@@ -286,81 +499,82 @@ class Function:
     def __init__(self, addr: int, name: str | None = None) -> None:
         self._addr = addr
         self._name = name
-
-    def _call_rax_indirect(self, addr: int) -> list[int]:
-        # The nop is important here as this code will be injected at the top of an executable
-        # map. Without the nop the debuggee will return to a SIGSEGV as it runs over the end of the
-        # map. With the nop we can set a breakpoint and move the PC elsewhere.
-        return [
-            0xFF,
-            0xD0,  # call rax
-            0x90,  # nop
-        ]
-
-    def _code(self, *args: int) -> tuple[list[int], int]:
-        code = [
-            *self._call_rax_indirect(self._addr),
-        ]
-        return code, len(code)
-
-    @functools.cache  # pylint: disable=method-cache-max-size-none
-    def _find_executable_space(self, length: int) -> int:
-        # this is lifted straight from out engine implementation of `info proc maps`
-        maps = []
-        with ctrl_c.deferred():
-            udb.gdbserial.send("vUDB;get_debuggee_maps")
-            with udb.gdbserial.receive_packet():
-                n = udb.gdbserial.receive_number()
-                for _ in range(n):
-                    m = engine.MemoryMap(
-                        begin=udb.gdbserial.receive_number(),
-                        end=udb.gdbserial.receive_number(),
-                        offset=udb.gdbserial.receive_number(),
-                        dev_major=udb.gdbserial.receive_number(),
-                        dev_minor=udb.gdbserial.receive_number(),
-                        inode=udb.gdbserial.receive_number(),
-                        path=udb.gdbserial.receive_hexstr(),
-                        read=bool(udb.gdbserial.receive_number()),
-                        write=bool(udb.gdbserial.receive_number()),
-                        execute=bool(udb.gdbserial.receive_number()),
-                        shared=bool(udb.gdbserial.receive_number()),
-                    )
-                    maps.append(m)
-        for mmap in maps:
-            if mmap.path.startswith("["):
-                continue
-            if mmap.execute:
-                # does this map have enough free space at the top end?
-                data = gdb.selected_inferior().read_memory(mmap.end - length, length)
-                if list(data) == [b"\x00" for _ in range(length)]:
-                    return mmap.end - length
-        assert False, "Can't find inject location"
+        self._abi = current_abi()
 
     def __call__(self, *args: int) -> int:
-        code, offset = self._code(*args)
-        addr = self._find_executable_space(len(code))
+        abi = self._abi
+        code = abi.code
+        addr = _find_executable_space(len(code))
         with (
             temporary_memory(addr, code),
             temporary_registers() as regs,
             gdbutils.breakpoints_suspended(),
         ):
             assert (
-                0 <= len(args) <= 6
-            ), f"Only 0-6 args supported in debuggee calls: {args}"
-            arg_regs = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
-            for i, reg_name in enumerate(arg_regs):
-                if i >= len(args):
-                    break
-                regs[reg_name] = args[i]
-            regs["rax"] = self._addr
+                0 <= len(args) <= len(abi.args)
+            ), f"Only 0-{len(abi.args)} args supported in debuggee calls: {args}"
+            for reg_name, value in zip(abi.args, args):
+                regs[reg_name] = value
+            regs[abi.function] = self._addr
+
+            x = _return_breakpoint(addr + len(code))
+            x.hit_count = 0
+            x.enabled = True
+            try:
+                gdb.execute(f"set $pc = {hex(addr)}")
+                gdbutils.execute_to_string("continue")
+            finally:
+                x.enabled = False
+
+            assert x.hit_count == 1, f"Call failed: 0x{self._addr:x}"
 
-            x = gdb.Breakpoint(f"*{hex(addr + offset)}", internal=True)
-            x.silent = True
+            return regs.read_current(abi.result)
 
-            gdb.execute(f"set $pc = {hex(addr)}")
-            gdbutils.execute_to_string("continue")
 
-            assert x.hit_count == 1, f"Call failed: 0x{self._addr:x}"
-            x.delete()
+_symbol_cache_clears: list[Callable[[], None]] = []
+"""
+Functions registered with `register_symbol_cache_clear`, called when object files are (un)loaded.
+"""
+
+
+def register_symbol_cache_clear(cache_clear: Callable[[], None]) -> None:
+    """
+    Register a function which discards a cache of symbols or addresses in the debuggee.
+
+    It's called whenever this module's own symbol caches are discarded, so that caches elsewhere
+    don't have to track object files being (un)loaded themselves.
+    """
+    _symbol_cache_clears.append(cache_clear)
+
+
+def _clear_symbol_caches(event: object) -> None:
+    """
+    GDB event handler which discards cached symbol and memory map lookups when object files are
+    (un)loaded.
+    """
+    symbol_exists.cache_clear()
+    get_symbol_address.cache_clear()
+    python_state.cache_clear()
+    _executable_map_ends.cache_clear()
+    _executable_space.clear()
+    Function._by_name.clear()  # pylint: disable=protected-access
+    for cache_clear in _symbol_cache_clears:
+        cache_clear()
+
+
+def _clear_python_state_cache(event: object) -> None:
+    """
+    GDB event handler which discards the cached Python interpreter state.
+    """
+    python_state.cache_clear()
+
+
+gdb.events.new_objfile.connect(_clear_symbol_caches)
+gdb.events.clear_objfiles.connect(_clear_symbol_caches)
+gdb.events.exited.connect(_clear_symbol_caches)
+if hasattr(gdb.events, "free_objfile"):
+    # The free_objfile event was added in GDB 13.
+    gdb.events.free_objfile.connect(_clear_symbol_caches)
 
-            return regs["rax"]
+gdb.events.cont.connect(_clear_python_state_cache)
+gdb.events.stop.connect(_clear_python_state_cache)
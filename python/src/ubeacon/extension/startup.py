@@ -4,17 +4,16 @@ import os
 import sys
 from pathlib import Path
 
-import gdb  # pyright: ignore[reportMissingModuleSource]
 from src.udbpy.gdb_extensions import (  # pyright: ignore[reportMissingModuleSource]
     command,
     udb_base,
 )
+from undo.debugger_extensions import udb as udb_wrapper
 
 
 @functools.cache
 def udb() -> udb_base.Udb:
-    gdb.execute("python sys._the_udb_for_ai = _udb")
-    return sys._the_udb_for_ai  # type: ignore[attr-defined]  # pylint: disable=no-member,protected-access
+    return udb_wrapper._wrapped_udb  # pylint: disable=protected-access
 
 
 def setup() -> None:
@@ -45,12 +44,17 @@ def setup() -> None:
 
 
 def add_path(p: Path) -> None:
-    sys.path.insert(0, str(p))
-
-    python_path = f"{os.environ.get('PYTHONPATH', '')}{os.pathsep}{str(p)}".rstrip(
-        os.pathsep
-    )
-    os.environ["PYTHONPATH"] = python_path
+    """
+    Add a directory to `sys.path` and `$PYTHONPATH`, unless it's already present.
+    """
+    path = str(p)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+    python_path = [x for x in os.environ.get("PYTHONPATH", "").split(os.pathsep) if x]
+    if path not in python_path:
+        python_path.append(path)
+        os.environ["PYTHONPATH"] = os.pathsep.join(python_path)
 
 
 setup()
@@ -8,20 +8,20 @@ breakpoints on these trace functions which correspond to 'normal' debugging oper
 Python code (next/step/finish etc.).
 """
 
+import atexit
 import contextlib
 import functools
+import hashlib
 import json
 import os
+import shutil
 import subprocess
 import tempfile
 from pathlib import Path
-from typing import Iterator, Type, TypeVar
+from typing import IO, Iterator, Type, TypeVar
 
 import gdb  # pyright: ignore[reportMissingModuleSource]
 import pydantic
-import pygments
-import pygments.formatters
-import pygments.lexers
 from src.udbpy import locations, report  # pyright: ignore[reportMissingModuleSource]
 from src.udbpy.gdb_extensions import gdbutils  # pyright: ignore[reportMissingModuleSource]
 
@@ -48,37 +48,17 @@ def build() -> Path:
     python_executable = progspace.executable_filename  # type: ignore[attr-defined]
     root = Path(__file__).resolve().parent.parent.parent.parent
 
-    # location of built library
-    cache_dir = locations.get_undo_cache_path("ubeacon")
+    # Builds are kept in a directory named after a hash of their inputs, so a build which exists
+    # is up to date. These are grouped by interpreter, so that only builds which are out of date
+    # for this interpreter are removed after building.
+    python_key = hashlib.blake2b(python_executable.encode(), digest_size=8).hexdigest()
+    python_dir = Path(locations.get_undo_cache_path("ubeacon"), python_key)
+    build_dir = python_dir / _build_key(root, python_executable)
 
     # See if it's already built
-    cp = subprocess.run(
-        [python_executable, "find_so.py", cache_dir], text=True, cwd=root, capture_output=True
-    )
-    if cp.returncode != 0:
-        report.user(f"Error occurred while running find_so.py to locate UBeacon library.")
-        report.user(f"Error output from find_so.py:\n{cp.stderr}")
-        report.user(f"Output from find_so.py:\n{cp.stdout}")
-        if "No module named 'setuptools'" in cp.stderr:
-            raise report.ReportableError(
-                """Error occurred in Python: setuptools is required to build the UBeacon library.
-
-                Please install it using `pip install setuptools`."""
-            )
-        raise report.ReportableError(
-            f"Error locating UBeacon library: {cp.stderr.strip() or 'Unknown error'}"
-        )
-    output = cp.stdout
-    if output:
-        lib_path = Path(output.strip())
-        if lib_path.is_file():
-            lib_dir = root / "src" / "ubeacon" / "lib"
-            # Check the timestamp of the library is newer than the source files
-            # if not, we need to rebuild
-            lib_mtime = lib_path.stat().st_mtime
-            source_files = list(lib_dir.glob("*.c")) + list(lib_dir.glob("*.h"))
-            if all(lib_mtime > source.stat().st_mtime for source in source_files):
-                return lib_path
+    lib_path = _recorded_lib_path(build_dir)
+    if lib_path is not None:
+        return lib_path
 
     # Not found, build it
     try:
@@ -88,7 +68,7 @@ def build() -> Path:
                 "setup.py",
                 "build",
                 "--quiet",
-                f"--build-base={cache_dir}",
+                f"--build-base={build_dir}",
             ],
             text=True,
             cwd=root,
@@ -110,19 +90,100 @@ def build() -> Path:
                 report.user(
                     f"Saved stderr to {tf.name}.\n"
                 )
+            if "No module named 'setuptools'" in exc.stderr:
+                raise report.ReportableError(
+                    "Error occurred in Python: setuptools is required to build the UBeacon "
+                    "library.\n\nPlease install it using `pip install setuptools`."
+                )
         raise report.ReportableError(
             """Error occurred in Python: could not debug this version of Python.
                                      
             You may need to install Python development headers for this version."""
         )
-    output = subprocess.check_output(
-        [python_executable, "find_so.py", cache_dir], text=True, cwd=root
-    )
-    lib_path = Path(output.strip())
-    assert lib_path.is_file(), f"Cannot find ubeacon library: {lib_path}"
+    lib_path = _recorded_lib_path(build_dir)
+    assert lib_path is not None, f"Cannot find ubeacon library in: {build_dir}"
+
+    # Remove builds from previous versions of the sources, as they can never be used again.
+    for old_build_dir in python_dir.iterdir():
+        if old_build_dir != build_dir:
+            shutil.rmtree(old_build_dir, ignore_errors=True)
+
     return lib_path
 
 
+def _build_key(root: Path, python_executable: str) -> str:
+    """
+    Return a hash of everything which affects the built library.
+    """
+    # Every directory with sources compiled into the extension by setup.py.
+    source_dirs = [root / "src" / "ubeacon" / "lib", root / "src" / "ext" / "cJSON"]
+    sources = []
+    for source_dir in source_dirs:
+        # List each directory once, rather than globbing it for each extension.
+        with os.scandir(source_dir) as entries:
+            sources.extend(
+                sorted(Path(entry.path) for entry in entries if entry.name.endswith((".c", ".h")))
+            )
+    sources.append(root / "setup.py")
+    key = hashlib.blake2b(digest_size=8)
+    # The interpreter is too large to hash on every startup, so identify it by its path and stat
+    # instead. This still catches it being upgraded in place.
+    python_stat = os.stat(python_executable)
+    key.update(f"{python_executable}:{python_stat.st_size}:{python_stat.st_mtime_ns}".encode())
+    # The environment variables read by setup.py and setuptools which change the compiled code.
+    for name in ("UBEACON_DEBUG", "CC", "CFLAGS", "CPPFLAGS", "LDFLAGS"):
+        key.update(f"{name}={os.environ.get(name)}\n".encode())
+    for source in sources:
+        key.update(str(source.relative_to(root)).encode())
+        key.update(source.read_bytes())
+    return key.hexdigest()
+
+
+def _recorded_lib_path(build_dir: Path) -> Path | None:
+    """
+    Return the path of the library built in `build_dir`, as recorded by setup.py, if there is one.
+    """
+    try:
+        lib_path = Path(Path(build_dir, ".ubeacon_so_path").read_text().strip())
+    except OSError:
+        return None
+    return lib_path if lib_path.is_file() else None
+
+
+def state_struct() -> gdb.Value:
+    """
+    Get the value of the UBeacon library's state struct in the debuggee.
+
+    The struct is a static variable, so it's looked up directly by symbol rather than by parsing an
+    expression.
+    """
+    symbol = _state_symbol()
+    if symbol is None:
+        return gdb.parse_and_eval(STATE_STRUCT)
+    return symbol.value()
+
+
+@functools.cache
+def _state_symbol() -> gdb.Symbol | None:
+    """
+    Look up the symbol for the UBeacon library's state struct.
+
+    The result is cached until the set of loaded object files changes.
+    """
+    return gdb.lookup_static_symbol(STATE_STRUCT)
+
+
+@functools.cache
+def state_field_address(field: str) -> int:
+    """
+    Get the address of a field of the UBeacon library's state struct in the debuggee.
+
+    The struct is static, so its address only changes when the library is loaded again. The result
+    is cached until the set of loaded object files changes.
+    """
+    return int(state_struct()[field].address)
+
+
 def require() -> None:
     """
     Guard function that raises exception if the UBeacon library is not loaded.
@@ -179,6 +240,40 @@ A generic type for use with `_call_dump_function`
 """
 
 
+_scratch_files: list[IO[bytes]] = []
+"""
+Temporary files which aren't currently in use by `_scratch_file`.
+"""
+
+
+@contextlib.contextmanager
+def _scratch_file() -> Iterator[IO[bytes]]:
+    """
+    A context manager providing an empty temporary file for the library to write its output to.
+
+    The files are reused, rather than created and removed for every call into the library. The
+    library truncates and writes to the file in place, so its contents can be read through the
+    file object rather than by opening it again.
+    """
+    try:
+        scratch = _scratch_files.pop()
+    except IndexError:
+        scratch = tempfile.NamedTemporaryFile()
+    try:
+        # Truncate the file, so that stale output isn't read if the library fails to write any.
+        scratch.seek(0)
+        scratch.truncate()
+        yield scratch
+    finally:
+        _scratch_files.append(scratch)
+
+
+@atexit.register
+def _remove_scratch_files() -> None:
+    while _scratch_files:
+        _scratch_files.pop().close()
+
+
 def _call_dump_function(func_name: str, model_type: Type[T]) -> T:
     """
     Call any ubeacon function that writes a temporary file filed with JSON data.
@@ -191,20 +286,28 @@ def _call_dump_function(func_name: str, model_type: Type[T]) -> T:
     require()
 
     # TODO: we should probably take the GIL here.
-    with tempfile.NamedTemporaryFile() as temp_file, debuggee.disable_volatile_warning_maybe():
+    with _scratch_file() as temp_file, debuggee.disable_volatile_warning_maybe():
         cmd = f'call {PREFIX}_interact_{func_name}("{temp_file.name}")'
         gdb.execute(cmd)
-        content = Path(temp_file.name).read_text()
+        content = temp_file.read()
 
-    model = model_type(**json.loads(content))
+    # Let pydantic parse the JSON itself, rather than building an intermediate dict to validate.
+    model = model_type.model_validate_json(content)
     return model
 
 
 def evaluate(code: str) -> str:
-    with tempfile.NamedTemporaryFile() as temp_file, debuggee.disable_volatile_warning_maybe():
-        cmd = f'call {PREFIX}_interact_eval("{temp_file.name}", "{code}")'
+    # The code is passed in a file, so that it doesn't need escaping in the call expression.
+    with (
+        _scratch_file() as temp_file,
+        _scratch_file() as code_file,
+        debuggee.disable_volatile_warning_maybe(),
+    ):
+        code_file.write(code.encode())
+        code_file.flush()
+        cmd = f'call {PREFIX}_interact_eval("{temp_file.name}", "{code_file.name}")'
         gdbutils.execute_to_string(cmd)
-        return Path(temp_file.name).read_text()
+        return temp_file.read().decode()
 
 
 class Frame(pydantic.BaseModel):
@@ -215,6 +318,8 @@ class Frame(pydantic.BaseModel):
     `s_ubeacon_frame_json()` function in the UBeacon C library.
     """
 
+    model_config = pydantic.ConfigDict(frozen=True)
+
     frame_no: int
     func_name: str
     file_name: Path
@@ -224,11 +329,14 @@ class Frame(pydantic.BaseModel):
         """
         Stringifies this `Frame` object in a way familiar to Python developers.
         """
+        return self._str
+
+    @functools.cached_property
+    def _str(self) -> str:
+        # The model is frozen, so its string form can be computed once and reused, e.g. by every
+        # redraw of the backtrace window until the debuggee moves.
         try:
-            contents = get_source_file_content(
-                self.file_name, line_nos=False, highlight=True
-            )
-            source_lines = contents.splitlines()
+            source_lines = get_source_lines(self.file_name, line_nos=False, highlight=True)
             source_line = source_lines[self.line - 1]
         except Exception:
             source_line = "<no source available>"
@@ -250,12 +358,18 @@ class Backtrace(pydantic.BaseModel):
     `s_ubeacon_backtrace_json()` function in the UBeacon C library.
     """
 
+    model_config = pydantic.ConfigDict(frozen=True)
+
     frames: list[Frame]
 
     def __str__(self) -> str:
         """
         Stringifies this `Backtrace` object in a way familiar to Python developers.
         """
+        return self._str
+
+    @functools.cached_property
+    def _str(self) -> str:
         if len(self) == 0:
             return "No Python traceback available."
         else:
@@ -279,13 +393,16 @@ def get_cached_source_file_content(file_name: Path) -> str:
     return file_name.read_text()
 
 
-@functools.cache
+@functools.lru_cache(maxsize=128)
 def get_source_file_content(
     file_name: Path, line_nos: bool = False, highlight: bool = False
 ) -> str:
     """
     Opens, reads and returns a file from the local machine.
 
+    Results are cached, as highlighting a file is far more expensive than looking it up. The cache
+    is bounded as the highlighted text is several times the size of the source.
+
     Args:
         file_name: The file to be loaded.
         line_nos: If true, each line wil be prefixed by a one-indexed line number.
@@ -296,6 +413,11 @@ def get_source_file_content(
     if not line_nos and not highlight:
         return content
 
+    # Imported here as pygments is slow to import and isn't needed until a source file is shown.
+    import pygments  # pylint: disable=import-outside-toplevel
+    import pygments.formatters  # pylint: disable=import-outside-toplevel
+    import pygments.lexers  # pylint: disable=import-outside-toplevel
+
     lexer = pygments.lexers.TextLexer()  # pylint: disable=no-member
     if highlight:
         lexer = pygments.lexers.PythonLexer(stripnl=False)  # pylint: disable=no-member
@@ -305,7 +427,27 @@ def get_source_file_content(
     )
 
 
+@functools.lru_cache(maxsize=128)
+def get_source_lines(
+    file_name: Path, line_nos: bool = False, highlight: bool = False
+) -> tuple[str, ...]:
+    """
+    Like `get_source_file_content`, but split into lines.
+
+    This is cached separately so that showing a single line doesn't split the whole file each time.
+    Lines are split only on "\n", matching Python's own line numbering, so that a form feed or other
+    line boundary recognised by `str.splitlines()` doesn't shift the following lines.
+    """
+    lines = get_source_file_content(file_name, line_nos, highlight).split("\n")
+    if lines[-1] == "":
+        # Drop the empty string after the final newline.
+        lines.pop()
+    return tuple(lines)
+
+
 class Local(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(frozen=True)
+
     name: str
     value: str
 
@@ -314,9 +456,15 @@ class Local(pydantic.BaseModel):
 
 
 class LocalList(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(frozen=True)
+
     locals: list[Local]
 
     def __str__(self) -> str:
+        return self._str
+
+    @functools.cached_property
+    def _str(self) -> str:
         if len(self) == 0:
             return "No locals."
         else:
@@ -386,20 +534,20 @@ class WatchChain(pydantic.BaseModel):
     def from_gdb(cls, chain_steps: list[dict]) -> "WatchChain":
         """Resolve a watch chain by calling the C function in the debuggee."""
         require()
-        with tempfile.NamedTemporaryFile(
-            mode="w", suffix=".json"
-        ) as input_file, tempfile.NamedTemporaryFile(
-            suffix=".json"
-        ) as output_file, debuggee.disable_volatile_warning_maybe():
-            json.dump(chain_steps, input_file)
+        with (
+            _scratch_file() as input_file,
+            _scratch_file() as output_file,
+            debuggee.disable_volatile_warning_maybe(),
+        ):
+            input_file.write(json.dumps(chain_steps).encode())
             input_file.flush()
             cmd = (
                 f'call {PREFIX}_interact_resolve_watch_chain'
                 f'("{output_file.name}", "{input_file.name}")'
             )
             gdb.execute(cmd)
-            content = Path(output_file.name).read_text()
-        return cls(**json.loads(content))
+            content = output_file.read()
+        return cls.model_validate_json(content)
 
 
 def stop_message() -> str:
@@ -411,22 +559,33 @@ def stop_message() -> str:
     return str(state.backtrace.frames[0])
 
 
+def _frame_condition(field: str, frame: str = "current_frame") -> str:
+    """
+    Build a condition which is true when `field` of the UBeacon state holds the frame which is
+    currently in its `frame` field.
+
+    Like the conditions on user breakpoints, this compares memory at a fixed address rather than
+    referring to `s_ubeacon` by name, as it's evaluated on every hit of a hot trace function.
+    """
+    frame_address = int(state_struct()[frame])
+    return f"*(uint64_t *){state_field_address(field)} == {frame_address}"
+
+
 def one_frame_up() -> str:
-    current_frame = int(gdb.parse_and_eval("s_ubeacon")["current_frame"])
-    return f"{STATE_STRUCT}.returned_from == {current_frame}"
+    return _frame_condition("current_frame", "caller_frame")
 
 
 def stay_in_frame() -> str:
-    current_frame = int(gdb.parse_and_eval("s_ubeacon")["current_frame"])
-    return f"{STATE_STRUCT}.current_frame == {current_frame}"
+    return _frame_condition("current_frame")
 
 
 def exception_origin(exception_name: str | None) -> str:
-    exception_origin = f"(uint32_t){STATE_STRUCT}.exception_origin == 1"
+    exception_origin = f"*(unsigned char *){state_field_address('exception_origin')} == 1"
 
     if exception_name:
         exception_type = (
-            f"{STATE_STRUCT}.exception_type_id == {_simple_hash(exception_name)}"
+            f"*(uint64_t *){state_field_address('exception_type_id')}"
+            f" == {_simple_hash(exception_name)}"
         )
         return f"{exception_type} && {exception_origin}"
     else:
@@ -437,20 +596,22 @@ def first_line_of_file() -> str:
     return f"{STATE_STRUCT}.current_line == 1"
 
 
+@functools.lru_cache(maxsize=4096)
 def _simple_hash(data_str: str) -> int:
     """
-    An implementation of the FNV-1 hash. Must match that in ubeacon.c's s_ubeacon_simple_hash().
+    An implementation of the FNV-1 hash. Must match that in trace.c's s_ubeacon_simple_hash().
 
     This function is not intended to be cryptographically secure, rather to map a string onto an
     integer in a way that's reasonably unlikely to collide. We do this as we can't set
     conditional breakpoints on string comparisons.
+
+    The library hashes the UTF-8 encoding of strings, so the same is done here. Results are cached
+    as the same file and function names are hashed repeatedly.
     """
     hash_value = 0xCBF29CE484222325
     prime = 0x100000001B3
-    for c in data_str:
-        hash_value ^= ord(c)
-        hash_value *= prime
-        hash_value &= 0xFFFFFFFFFFFFFFFF
+    for byte in data_str.encode():
+        hash_value = ((hash_value ^ byte) * prime) & 0xFFFFFFFFFFFFFFFF
     return hash_value
 
 
@@ -514,7 +675,7 @@ class ExternalBreakpoint(gdb.Breakpoint):
         """
         A message to be printed when this breakpoint is hit.
         """
-        ubeacon = gdb.parse_and_eval("s_ubeacon")
+        ubeacon = state_struct()
         current_func = ubeacon["current_func"].string()
         current_file = ubeacon["current_file"].string()
         current_line = int(ubeacon["current_line"])
@@ -550,18 +711,13 @@ class FileLineBreakpoint(ExternalBreakpoint):
         self.condition = self._build_condition()
 
     def _build_condition(self) -> str:
-        ubeacon = gdb.parse_and_eval("s_ubeacon")
         file_hash = _simple_hash(self._file)
-        line_cond = (
-            f"*(uint64_t *){int(ubeacon['current_line'].address)} == {self._line}"
-        )
-        file_cond = (
-            f"*(uint64_t *){int(ubeacon['current_file_id'].address)} == {file_hash}"
-        )
+        line_cond = f"*(uint64_t *){state_field_address('current_line')} == {self._line}"
+        file_cond = f"*(uint64_t *){state_field_address('current_file_id')} == {file_hash}"
         return f"{line_cond} && {file_cond}"
 
     def stop(self) -> bool:
-        ubeacon = gdb.parse_and_eval("s_ubeacon")
+        ubeacon = state_struct()
         file_correct = str(ubeacon["current_file"].string()).endswith(self._file)
         line_correct = int(ubeacon["current_line"]) == self._line
         if file_correct and line_correct:
@@ -587,16 +743,14 @@ class FunctionBreakpoint(ExternalBreakpoint):
         self.condition = self._build_condition()
 
     def _build_condition(self) -> str:
-        ubeacon = gdb.parse_and_eval("s_ubeacon")
         func_hash = _simple_hash(self._func)
-        func_cond = (
-            f"*(uint64_t *){int(ubeacon['current_func_id'].address)} == {func_hash}"
-        )
-        first_line_cond = f"*(uint64_t *){int(ubeacon['first_line'].address)} == 1"
+        func_cond = f"*(uint64_t *){state_field_address('current_func_id')} == {func_hash}"
+        # first_line is a bool, so only compare its single byte.
+        first_line_cond = f"*(unsigned char *){state_field_address('first_line')} == 1"
         return f"{func_cond} && {first_line_cond}"
 
     def stop(self) -> bool:
-        ubeacon = gdb.parse_and_eval("s_ubeacon")
+        ubeacon = state_struct()
         func_correct = str(ubeacon["current_func"].string()).endswith(self._func)
         first_correct = int(ubeacon["first_line"]) == 1
         if func_correct and first_correct:
@@ -627,7 +781,12 @@ def _stop_handler(event: gdb.StopEvent) -> None:
     state.clear()
 
 
-breakpoints: list[ExternalBreakpoint] = []
+debuggee.register_symbol_cache_clear(_state_symbol.cache_clear)
+debuggee.register_symbol_cache_clear(state_field_address.cache_clear)
+
+
+breakpoints: dict[int, ExternalBreakpoint] = {}
+"""User-visible Python breakpoints, keyed by their index."""
 active: bool = False
 
 
@@ -639,8 +798,9 @@ class DebuggeeState:
     If not currently executing Python code, the list of frames will be empty.
     Lazily updated on request."""
 
-    locals: LocalList = LocalList(locals=[])
-    """Latest list of local variables in the current Python frame."""
+    _locals: LocalList | None = None
+    """Latest list of local variables in the current Python frame.
+    Lazily updated on request."""
 
     @property
     def backtrace(self) -> Backtrace:
@@ -652,19 +812,33 @@ class DebuggeeState:
         if self._backtrace is None:
             if debuggee.symbol_exists(STATE_STRUCT):
                 self._backtrace = Backtrace.from_gdb()
-                self.locals = LocalList.from_gdb()
             else:
                 self._backtrace = Backtrace(frames=[])
-                self.locals = LocalList(locals=[])
 
         return self._backtrace
 
+    @property
+    def locals(self) -> LocalList:
+        """
+        The local variables of the current Python frame.
+
+        Unlike the backtrace, which is needed to report every stop, these are only fetched when
+        they are shown, as doing so calls `repr()` on each of them in the debuggee.
+        """
+        if self._locals is None:
+            if debuggee.symbol_exists(STATE_STRUCT):
+                self._locals = LocalList.from_gdb()
+            else:
+                self._locals = LocalList(locals=[])
+
+        return self._locals
+
     def clear(self) -> None:
         """
         Clear all cached debuggee state.
         """
         self._backtrace = None
-        self.locals = LocalList(locals=[])
+        self._locals = None
 
 
 state = DebuggeeState()
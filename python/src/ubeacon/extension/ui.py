@@ -1,14 +1,25 @@
+from pathlib import Path
+
 import gdb
 
 from src.udbpy.gdb_extensions import gdbutils  # pyright: ignore[reportMissingModuleSource]
 
 from . import tui_windows, ubeacon
 
+
 @tui_windows.register_window("python-source")
 class PythonSourceWindow(tui_windows.ScrollableWindow):
     title = "Python Source"
     no_src_msg = "No source code available"
 
+    # The window is redrawn before every prompt, but the content only depends on the current file
+    # and line, so remember the last content generated.
+    _last_location: tuple[Path, int] | None = None
+    _last_content: str = ""
+    # The prefixed lines of the file at `_last_location`, which are updated in place when only the
+    # current line changes.
+    _prefixed_lines: list[str]
+
     def get_content(self) -> str:
         try:
             if len(ubeacon.state.backtrace.frames) == 0:
@@ -17,22 +28,32 @@ class PythonSourceWindow(tui_windows.ScrollableWindow):
             frame = ubeacon.state.backtrace.frames[0]
             filename = frame.file_name
             line = frame.line
-            lines = ubeacon.get_source_file_content(
-                filename, line_nos=True, highlight=True
-            ).split("\n")
-            prefixed_lines = [
-                (" > " if i == line else "   ") + l
-                for i, l in enumerate(lines, start=1)
-            ]
 
             # Set vertical scroll offset to center the current line
             half_window_height = self._tui_window.height // 2
             self.vscroll_offset = line - half_window_height
 
-            return "\n".join(prefixed_lines)
+            if self._last_location != (filename, line):
+                if self._last_location is None or self._last_location[0] != filename:
+                    lines = ubeacon.get_source_lines(filename, line_nos=True, highlight=True)
+                    self._prefixed_lines = ["   " + l for l in lines]
+                else:
+                    self._mark_line(self._last_location[1], "   ")
+                self._mark_line(line, " > ")
+                self._last_content = "\n".join(self._prefixed_lines)
+                self._last_location = (filename, line)
+
+            return self._last_content
         except Exception:
             return self.no_src_msg
 
+    def _mark_line(self, line: int, prefix: str) -> None:
+        """
+        Replace the prefix of a one-indexed line in `_prefixed_lines`.
+        """
+        if 0 < line <= len(self._prefixed_lines):
+            self._prefixed_lines[line - 1] = prefix + self._prefixed_lines[line - 1][3:]
+
 
 @tui_windows.register_window("python-backtrace")
 class PythonBacktraceWindow(tui_windows.ScrollableWindow):
@@ -90,10 +90,10 @@ class _HwWatchpoint(gdb.Breakpoint):
         """Called by GDB when this watchpoint fires.
 
         We cannot safely call into the debuggee from here, so we just
-        set a flag.  The caller is responsible for calling
+        record the owner as pending.  The caller is responsible for calling
         :func:`evaluate_pending` once ``gdb.execute`` has returned.
         """
-        self._owner._pending_report = True
+        _pending.add(self._owner)
         return True
 
 
@@ -114,7 +114,6 @@ class PythonWatch:
 
         self._watchpoints: list[_HwWatchpoint] = []
         self._prev_value: str | None = None
-        self._pending_report: bool = False
 
     def install(self) -> None:
         """Set hardware watchpoints on every resolved storage and guard address."""
@@ -181,6 +180,9 @@ class PythonWatch:
 # Module-level state.
 watches: list[PythonWatch] = []
 
+# Watches with a hardware watchpoint which fired since they were last evaluated.
+_pending: set[PythonWatch] = set()
+
 
 def add_watch(expr: str) -> PythonWatch:
     """Parse an expression, resolve its chain, install watchpoints, and register it."""
@@ -198,6 +200,7 @@ def remove_watch(num: int) -> None:
         for w in watches:
             w.remove()
         watches.clear()
+        _pending.clear()
     else:
         target = None
         for w in watches:
@@ -208,11 +211,12 @@ def remove_watch(num: int) -> None:
             raise report.ReportableError(f"No Python watchpoint number {num}.")
         target.remove()
         watches.remove(target)
+        _pending.discard(target)
 
 
 def any_pending() -> bool:
     """Return True if any watch had a hardware watchpoint fire."""
-    return any(w._pending_report for w in watches)
+    return bool(_pending)
 
 
 def evaluate_pending() -> bool:
@@ -223,11 +227,12 @@ def evaluate_pending() -> bool:
     inside a stop handler) so that ``evaluate()`` is safe to call.
     """
     changed = False
-    for w in watches:
-        if w._pending_report:
-            w._pending_report = False
-            if w._do_report():
-                changed = True
+    # Report in the order the watches were created, as before.
+    pending = sorted(_pending, key=lambda w: w.index)
+    _pending.clear()
+    for w in pending:
+        if w._do_report():
+            changed = True
     return changed
 
 
@@ -238,6 +243,6 @@ def report_pending() -> None:
     ``gdb.execute`` has returned).  Handles both hardware-watchpoint-
     triggered watches and the evaluate-and-compare fallback.
     """
+    _pending.clear()
     for w in watches:
-        w._pending_report = False
         w._do_report()
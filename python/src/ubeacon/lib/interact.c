@@ -4,9 +4,10 @@
  *  In order to debug the Python interpreter various bits of interpreter state must be accessible to
  *  the debugger. This file contains functions to expose that information in an easy to consume
  *  manner. As the functions in this file are not typically called from anywhere in the normal
- *  execution paths of the application they are marked with the `unused` attribute to keep the
- *  compiler happy. These functions will be called from the `udb_extension` Python module that is
- *  sourced into UDB, so it's important that they remain in the UBeacon record time library.
+ *  execution paths of the application they are marked with the `used` attribute so that the
+ *  compiler does not discard them when optimizing. These functions will be called from the
+ *  `udb_extension` Python module that is sourced into UDB, so it's important that they remain in
+ *  the UBeacon record time library.
  */
 
 #include <stdio.h>
@@ -198,7 +199,7 @@ s_dict_value_addr(PyDictObject *dict, const char *key_str)
  *
  *  \param path A path to which the files JSON object will be written.
  */
-__attribute__((unused))
+__attribute__((used))
 static void
 s_ubeacon_interact_files_json(const char* path)
 {
@@ -321,7 +322,7 @@ fail:
  *
  *  \param path A path to which the backtrace JSON object will be written.
  */
-__attribute__((unused))
+__attribute__((used))
 static void
 s_ubeacon_interact_backtrace_json(const char* path)
 {
@@ -414,7 +415,7 @@ fail_py_name:
  *
  *  \param path A path to which the locals JSON object will be written.
  */
-__attribute__((unused))
+__attribute__((used))
 static void
 s_ubeacon_interact_locals_json(const char *path)
 {
@@ -488,6 +489,34 @@ s_err_to_file(FILE *fp)
 }
 
 
+/**
+ *  \brief Read the entire contents of a file into a heap-allocated string.
+ *
+ *  The caller is responsible for freeing the returned string.
+ *
+ *  \param path The path to the file to read.
+ *  \return A null-terminated string containing the file contents, or NULL on failure.
+ */
+static char *
+s_read_file(const char *path)
+{
+    FILE *f = fopen(path, "r");
+    if (!f) return NULL;
+
+    fseek(f, 0, SEEK_END);
+    long len = ftell(f);
+    fseek(f, 0, SEEK_SET);
+
+    char *buf = malloc(len + 1);
+    if (!buf) { fclose(f); return NULL; }
+
+    fread(buf, 1, len, f);
+    buf[len] = '\0';
+    fclose(f);
+    return buf;
+}
+
+
 /**
  *  \brief Execute some Python code and print the result.
  *
@@ -496,18 +525,26 @@ s_err_to_file(FILE *fp)
  *  process state. This method is intended to be called from the UDB command line, which will
  *  execute this function only in an ephemoral `fork()`ed copy of the original process.
  *
+ *  The code is passed in a file, rather than as a string argument, so that the debugger doesn't
+ *  have to quote it as a C string literal in the expression that calls this function.
+ *
  *  \param path A path to which the resulting expression will be written.
- *  \param code The code to be evaluated.
+ *  \param code_path A path from which the code to be evaluated will be read.
  */
-__attribute__((unused))
+__attribute__((used))
 static void
-s_ubeacon_interact_eval(const char* path, const char *code)
+s_ubeacon_interact_eval(const char* path, const char *code_path)
 {
     FILE *file = NULL;
     file = fopen(path, "w");
     assert(file != NULL);
 
-    if (Py_IsInitialized())
+    char *code = s_read_file(code_path);
+    if (!code)
+    {
+        fprintf(file, "Error: could not read code from %s\n", code_path);
+    }
+    else if (Py_IsInitialized())
     {
         PyGILState_STATE state = PyGILState_Ensure();
         PyObject *locals = PyEval_GetLocals();
@@ -532,10 +569,11 @@ s_ubeacon_interact_eval(const char* path, const char *code)
         PyGILState_Release(state);
     }
 
+    free(code);
     fclose(file);
 }
 
-__attribute__((unused))
+__attribute__((used))
 static void
 s_ubeacon_interact_exception_type(PyObject *exc_info)
 {
@@ -562,34 +600,6 @@ s_ubeacon_interact_exception_type(PyObject *exc_info)
 }
 
 
-/**
- *  \brief Read the entire contents of a file into a heap-allocated string.
- *
- *  The caller is responsible for freeing the returned string.
- *
- *  \param path The path to the file to read.
- *  \return A null-terminated string containing the file contents, or NULL on failure.
- */
-static char *
-s_read_file(const char *path)
-{
-    FILE *f = fopen(path, "r");
-    if (!f) return NULL;
-
-    fseek(f, 0, SEEK_END);
-    long len = ftell(f);
-    fseek(f, 0, SEEK_SET);
-
-    char *buf = malloc(len + 1);
-    if (!buf) { fclose(f); return NULL; }
-
-    fread(buf, 1, len, f);
-    buf[len] = '\0';
-    fclose(f);
-    return buf;
-}
-
-
 /**
  *  \brief Create a cJSON link object describing one resolved step in a watch chain.
  *
@@ -716,7 +726,7 @@ typedef struct {
  *  \param output_path Path to which the resolved chain JSON will be written.
  *  \param input_path  Path from which the chain description JSON will be read.
  */
-__attribute__((unused))
+__attribute__((used))
 static void
 s_ubeacon_interact_resolve_watch_chain(const char *output_path, const char *input_path)
 {
@@ -49,7 +49,9 @@ s_ubeacon_simple_hash(const char *data_str)
 
     for (size_t i = 0; data_str[i] != '\0'; i++)
     {
-        hash ^= (uint64_t)data_str[i];
+        /* Go via unsigned char so that bytes >= 0x80 aren't sign extended where char is signed,
+         * to match the Python implementation. */
+        hash ^= (uint64_t)(unsigned char)data_str[i];
         hash *= prime;
     }
 
@@ -61,15 +63,19 @@ s_ubeacon_simple_hash(const char *data_str)
  *  \brief Calculate the depth of the current Python stack.
  *
  *  \param top_level A Python frame object corresponding the top-most frame of the Python stack.
+ *  \param caller Set to the frame which called `top_level`, or NULL if there isn't one. No
+ *                reference is held on it.
  *  \return An integer greater than zero corresponding to the depth of the stack.
  */
 static int
-s_calculate_stack_depth(PyFrameObject *top_level)
+s_calculate_stack_depth(PyFrameObject *top_level, PyFrameObject **caller)
 {
     uint64_t depth = 0;
+    *caller = NULL;
     for (PyFrameObject *frame = top_level; frame != NULL; frame = PyFrame_GetBack(frame))
     {
         depth++;
+        if (depth == 2) *caller = frame;
 
         /* We don't want to decrement the reference count on the top level frame, as it was passed
          * into `s_trace_entry_point()` with it's reference count already incremented. The caller of
@@ -162,17 +168,20 @@ s_is_exception_origin(PyObject *exc_info, PyObject *current_frame)
  *  \brief Empty function for setting breakpoints on specific Python events.
  *
  *  This function, and it's counterparts are completely empty, but we don't want the compiler to
- *  optimize them away. As such, it's vital that the -O0 option is passed to the compiler. The
- *  `optimize` attribute was initially used to try and ensure that only these functions were
- *  unoptimized, however a compiler bug causes incorrect debuginfo in this case, breaking the
- *  libraries functionality.
+ *  optimize them away. The `optimize` attribute was initially used to try and ensure that only
+ *  these functions were unoptimized, however a compiler bug causes incorrect debuginfo in this
+ *  case, breaking the libraries functionality. Instead, they are marked `noinline` and `used`, and
+ *  contain an empty volatile asm statement so that calls to them are not elided as side-effect
+ *  free. This allows the rest of the library to be built with optimizations enabled.
  *
  *  \see s_ubeacon_trace_ret() s_ubeacon_trace_line() s_ubeacon_trace_exception()
  */
-static void s_ubeacon_trace_call() {}
-static void s_ubeacon_trace_ret() {}
-static void s_ubeacon_trace_line() {}
-static void s_ubeacon_trace_exception() {}
+#define UBEACON_TRACE_HOOK __attribute__((noinline, used))
+
+UBEACON_TRACE_HOOK static void s_ubeacon_trace_call() { __asm__ volatile(""); }
+UBEACON_TRACE_HOOK static void s_ubeacon_trace_ret() { __asm__ volatile(""); }
+UBEACON_TRACE_HOOK static void s_ubeacon_trace_line() { __asm__ volatile(""); }
+UBEACON_TRACE_HOOK static void s_ubeacon_trace_exception() { __asm__ volatile(""); }
 
 
 /**
@@ -193,7 +202,8 @@ static void s_ubeacon_trace_exception() {}
 static int
 s_trace_entry_point(PyObject *obj, PyFrameObject *frame, int what, PyObject *arg)
 {
-    uint64_t depth = s_calculate_stack_depth(frame);
+    PyFrameObject *caller;
+    uint64_t depth = s_calculate_stack_depth(frame, &caller);
 
     PyCodeObject *code = PyFrame_GetCode(frame);
     assert(code != NULL);
@@ -212,6 +222,7 @@ s_trace_entry_point(PyObject *obj, PyFrameObject *frame, int what, PyObject *arg
     ubeacon_get()->current_line = PyFrame_GetLineNumber(frame);
     Py_XDECREF(ubeacon_get()->current_frame);
     ubeacon_get()->current_frame = frame;
+    ubeacon_get()->caller_frame = caller;
     ubeacon_get()->current_func_id = s_ubeacon_simple_hash(func_name);
     ubeacon_get()->exception_origin = false;
     Py_XDECREF(ubeacon_get()->exception_info);
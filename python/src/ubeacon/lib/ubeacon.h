@@ -16,6 +16,9 @@ typedef struct
     uint64_t current_func_id;
 
     PyFrameObject *current_frame;
+    /* Not a reference. The caller's frame object is kept alive by the interpreter until it
+     * returns, which can't happen before `current_frame` returns. */
+    PyFrameObject *caller_frame;
     uint64_t current_depth;
     bool first_line;
 